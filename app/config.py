@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 import os
-from dataclasses import dataclass, field, asdict
+from dataclasses import dataclass
 from typing import Optional
 
 
@@ -9,7 +9,35 @@ DEFAULT_API_KEY = os.getenv("API_KEY") or os.getenv("ODIDO_API_KEY")
 DEFAULT_BUNDLE_CODE = "A0DAY01"
 
 
-@dataclass
+def _optional_str(value) -> Optional[str]:
+    return str(value) if value is not None else None
+
+
+_STR_FIELDS = frozenset({"api_key", "log_level", "bundle_code", "odido_user_id", "odido_token"})
+_FLOAT_FIELDS = frozenset({"bundle_size_mb", "absolute_min_threshold_mb"})
+_INT_FIELDS = frozenset(
+    {
+        "lead_time_minutes",
+        "min_check_interval_minutes",
+        "max_check_interval_minutes",
+        "estimator_window_minutes",
+        "estimator_max_events",
+        "default_bundle_valid_hours",
+        "log_retention_minutes",
+    }
+)
+_BOOL_FIELDS = frozenset({"auto_renew_enabled"})
+
+# Maps each configurable field to the callable used to coerce incoming values.
+_COERCE = {
+    **{name: _optional_str for name in _STR_FIELDS},
+    **{name: float for name in _FLOAT_FIELDS},
+    **{name: int for name in _INT_FIELDS},
+    **{name: bool for name in _BOOL_FIELDS},
+}
+
+
+@dataclass(slots=True)
 class AppConfig:
     api_key: Optional[str] = DEFAULT_API_KEY or "changeme"
     bundle_size_mb: float = 1024.0
@@ -22,6 +50,7 @@ class AppConfig:
     auto_renew_enabled: bool = True
     default_bundle_valid_hours: int = 24 * 30
     log_level: str = "INFO"
+    log_retention_minutes: int = 7 * 24 * 60
     # Odido API integration settings
     bundle_code: str = DEFAULT_BUNDLE_CODE
     odido_user_id: Optional[str] = None
@@ -29,26 +58,28 @@ class AppConfig:
 
     def update_from_dict(self, data: dict) -> None:
         for key, value in data.items():
-            if not hasattr(self, key):
-                continue
-            if key in {"api_key", "log_level", "bundle_code", "odido_user_id", "odido_token"}:
-                setattr(self, key, str(value) if value is not None else None)
-            elif key in {
-                "bundle_size_mb",
-                "absolute_min_threshold_mb",
-                "lead_time_minutes",
-                "min_check_interval_minutes",
-                "max_check_interval_minutes",
-                "estimator_window_minutes",
-                "estimator_max_events",
-                "default_bundle_valid_hours",
-            }:
-                setattr(self, key, float(value) if "mb" in key else int(value))
-            elif key in {"auto_renew_enabled"}:
-                setattr(self, key, bool(value))
+            coerce = _COERCE.get(key)
+            if coerce is not None:
+                setattr(self, key, coerce(value))
 
     def as_dict(self) -> dict:
-        return asdict(self)
+        return {
+            "api_key": self.api_key,
+            "bundle_size_mb": self.bundle_size_mb,
+            "absolute_min_threshold_mb": self.absolute_min_threshold_mb,
+            "estimator_window_minutes": self.estimator_window_minutes,
+            "estimator_max_events": self.estimator_max_events,
+            "min_check_interval_minutes": self.min_check_interval_minutes,
+            "max_check_interval_minutes": self.max_check_interval_minutes,
+            "lead_time_minutes": self.lead_time_minutes,
+            "auto_renew_enabled": self.auto_renew_enabled,
+            "default_bundle_valid_hours": self.default_bundle_valid_hours,
+            "log_level": self.log_level,
+            "log_retention_minutes": self.log_retention_minutes,
+            "bundle_code": self.bundle_code,
+            "odido_user_id": self.odido_user_id,
+            "odido_token": self.odido_token,
+        }
 
     @classmethod
     def from_dict(cls, data: dict) -> "AppConfig":
@@ -57,7 +88,7 @@ class AppConfig:
         return obj
 
 
-@dataclass
+@dataclass(slots=True)
 class BundleState:
     remaining_mb: float = 0.0
     used_today_mb: float = 0.0
@@ -69,7 +100,16 @@ class BundleState:
     last_check_ts: Optional[float] = None
 
     def as_dict(self) -> dict:
-        return asdict(self)
+        return {
+            "remaining_mb": self.remaining_mb,
+            "used_today_mb": self.used_today_mb,
+            "total_used_mb": self.total_used_mb,
+            "expiry_ts": self.expiry_ts,
+            "next_check_ts": self.next_check_ts,
+            "next_reset_ts": self.next_reset_ts,
+            "estimated_depletion_ts": self.estimated_depletion_ts,
+            "last_check_ts": self.last_check_ts,
+        }
 
     @classmethod
     def from_dict(cls, data: dict) -> "BundleState":
@@ -1,29 +1,66 @@
 from __future__ import annotations
 
+import threading
 import time
-from typing import Iterable, Tuple
+from bisect import insort
+from collections import deque
+from typing import Deque, Iterable, Optional, Tuple
 
 
 class ConsumptionEstimator:
-    def __init__(self, window_minutes: int = 60, max_events: int = 24):
+    """Rolling consumption-rate estimate over the most recent usage events.
+
+    Events are kept oldest-first in a deque bounded by the time window and
+    ``max_events``, with a running total so each update is O(1) amortized.
+    Reading the rate also evicts expired events, so both paths share a small
+    lock of their own rather than the service-wide one.
+    """
+
+    def __init__(
+        self,
+        window_minutes: int = 60,
+        max_events: int = 24,
+        events: Iterable[Tuple[float, float]] = (),
+    ):
         self.window_minutes = window_minutes
         self.max_events = max_events
+        self._events: Deque[Tuple[float, float]] = deque()
+        self._running_total = 0.0
+        self._lock = threading.Lock()
+        for ts, amount in sorted(events):
+            self.add_event(ts, amount)
+
+    def add_event(self, ts: float, amount: float) -> None:
+        with self._lock:
+            events = self._events
+            if events and ts < events[-1][0]:
+                # Back-dated usage; keep the buffer ordered by timestamp.
+                insort(events, (ts, amount))
+            else:
+                events.append((ts, amount))
+            self._running_total += amount
+            self._evict(time.time())
+
+    def _evict(self, now: float) -> None:
+        events = self._events
+        popleft = events.popleft
+        window_start = now - self.window_minutes * 60
+        max_events = self.max_events
+        total = self._running_total
+        while events and (events[0][0] < window_start or len(events) > max_events):
+            total -= popleft()[1]
+        # Reset when empty so float error from repeated subtraction cannot accumulate.
+        self._running_total = total if events else 0.0
 
-    def rate_mb_per_minute(self, usage_events: Iterable[Tuple[float, float]]) -> float:
-        now = time.time()
-        window_seconds = self.window_minutes * 60
-        total = 0.0
-        earliest = None
-        count = 0
-        for ts, amount in usage_events:
-            if now - ts > window_seconds:
-                continue
-            total += amount
-            earliest = ts if earliest is None else min(earliest, ts)
-            count += 1
-            if count >= self.max_events:
-                break
-        if total <= 0 or earliest is None:
-            return 0.0
-        elapsed = max((now - earliest) / 60.0, 1e-6)
+    def rate_mb_per_minute(self, now: Optional[float] = None) -> float:
+        if now is None:
+            now = time.time()
+        with self._lock:
+            self._evict(now)
+            events = self._events
+            total = self._running_total
+            if total <= 0 or not events:
+                return 0.0
+            oldest_ts = events[0][0]
+        elapsed = max((now - oldest_ts) / 60.0, 1e-6)
         return total / elapsed
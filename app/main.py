@@ -1,19 +1,25 @@
 from __future__ import annotations
 
+import importlib.util
 import logging
 import os
-import signal
 import threading
 import time
 from typing import Optional
 
 from fastapi import Depends, FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 import uvicorn
 
-from .config import AppConfig
-from .odido_api import OdidoAPI, OdidoAPIError, OdidoAuthError
+from .odido_api import (
+    OdidoAPI,
+    OdidoAPIError,
+    OdidoAuthError,
+    close_http_client,
+    get_http_client,
+    get_odido_api,
+)
 from .scheduler import Scheduler
 from .service import BundleService
 from .storage import Storage
@@ -21,7 +27,11 @@ from .storage import Storage
 logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
 logger = logging.getLogger("odido.main")
 
-app = FastAPI(title="Odido Bundle Booster", version="1.0.0")
+app = FastAPI(
+    title="Odido Bundle Booster",
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+)
 storage = Storage()
 service = BundleService(storage)
 scheduler = Scheduler(service)
@@ -41,13 +51,19 @@ def verify_api_key(x_api_key: Optional[str] = Header(default=None)):
 
 
 @app.on_event("startup")
-def startup_event():
+async def startup_event():
+    # The module-level storage may have been closed by an earlier lifespan.
+    storage.open()
+    # Create the shared HTTP client on the serving event loop.
+    get_http_client()
     scheduler.start()
 
 
 @app.on_event("shutdown")
-def shutdown_event():
-    scheduler.stop()
+async def shutdown_event():
+    await scheduler.stop()
+    await close_http_client()
+    storage.close()
 
 
 @app.get("/api/status")
@@ -58,6 +74,7 @@ def get_status(_: None = Depends(verify_api_key)):
 @app.post("/api/config")
 def post_config(payload: dict, _: None = Depends(verify_api_key)):
     config = service.update_config(payload)
+    get_odido_api.cache_clear()
     return config.as_dict()
 
 
@@ -90,34 +107,33 @@ def post_health():
 
 
 def _get_odido_api() -> OdidoAPI:
-    """Create an Odido API client using configured credentials."""
-    config = service.config
-    return OdidoAPI(
-        user_id=config.odido_user_id or os.getenv("ODIDO_USER_ID"),
-        access_token=config.odido_token or os.getenv("ODIDO_TOKEN"),
-    )
+    """Dependency returning the shared Odido API client for the configured credentials."""
+    return service._get_odido_api()
 
 
 @app.get("/api/odido/bundles")
-def get_odido_bundles(_: None = Depends(verify_api_key)):
+async def get_odido_bundles(
+    api: OdidoAPI = Depends(_get_odido_api), _: None = Depends(verify_api_key)
+):
     """
     Fetch available bundle information from the Odido API.
     
     Returns roaming bundle details including remaining data and zone information.
     Requires ODIDO_USER_ID and ODIDO_TOKEN to be configured.
     """
-    api = _get_odido_api()
     if not api.is_configured:
         raise HTTPException(
             status_code=400,
             detail="Odido API credentials not configured. Set ODIDO_USER_ID and ODIDO_TOKEN environment variables or configure via /api/config",
         )
     try:
-        bundles = api.get_roaming_bundles()
-        return {
-            "bundles": [b.as_dict() for b in bundles],
-            "total_remaining_mb": api.get_remaining_data_mb(),
-        }
+        bundles = await api.get_roaming_bundles()
+        return ORJSONResponse(
+            {
+                "bundles": [b.as_dict() for b in bundles],
+                "total_remaining_mb": await api.get_remaining_data_mb(),
+            }
+        )
     except OdidoAuthError as e:
         raise HTTPException(status_code=401, detail=str(e))
     except OdidoAPIError as e:
@@ -125,7 +141,9 @@ def get_odido_bundles(_: None = Depends(verify_api_key)):
 
 
 @app.get("/api/odido/bundle-codes")
-def get_bundle_codes(_: None = Depends(verify_api_key)):
+def get_bundle_codes(
+    api: OdidoAPI = Depends(_get_odido_api), _: None = Depends(verify_api_key)
+):
     """
     Get available bundle buying codes.
     
@@ -133,15 +151,20 @@ def get_bundle_codes(_: None = Depends(verify_api_key)):
     Note: The Odido API does not provide an endpoint to list available codes,
     so this returns commonly used codes based on reference implementations.
     """
-    api = _get_odido_api()
-    return {
-        "bundle_codes": api.get_available_bundle_codes(),
-        "configured_code": service.config.bundle_code,
-    }
+    return ORJSONResponse(
+        {
+            "bundle_codes": api.get_available_bundle_codes(),
+            "configured_code": service.config.bundle_code,
+        }
+    )
 
 
 @app.post("/api/odido/buy-bundle")
-def buy_odido_bundle(payload: dict, _: None = Depends(verify_api_key)):
+async def buy_odido_bundle(
+    payload: dict,
+    api: OdidoAPI = Depends(_get_odido_api),
+    _: None = Depends(verify_api_key),
+):
     """
     Purchase a bundle from Odido using the specified or configured buying code.
     
@@ -150,7 +173,6 @@ def buy_odido_bundle(payload: dict, _: None = Depends(verify_api_key)):
     
     Requires ODIDO_USER_ID and ODIDO_TOKEN to be configured.
     """
-    api = _get_odido_api()
     if not api.is_configured:
         raise HTTPException(
             status_code=400,
@@ -160,7 +182,7 @@ def buy_odido_bundle(payload: dict, _: None = Depends(verify_api_key)):
     buying_code = payload.get("buying_code") or service.config.bundle_code
     
     try:
-        result = api.buy_bundle(buying_code=buying_code)
+        result = await api.buy_bundle(buying_code=buying_code)
         service._log("INFO", f"Bundle purchased via Odido API with code: {buying_code}")
         return result
     except OdidoAuthError as e:
@@ -170,22 +192,23 @@ def buy_odido_bundle(payload: dict, _: None = Depends(verify_api_key)):
 
 
 @app.get("/api/odido/subscriptions")
-def get_odido_subscriptions(_: None = Depends(verify_api_key)):
+async def get_odido_subscriptions(
+    api: OdidoAPI = Depends(_get_odido_api), _: None = Depends(verify_api_key)
+):
     """
     Fetch subscription details from the Odido API.
     
     Returns information about linked subscriptions.
     Requires ODIDO_USER_ID and ODIDO_TOKEN to be configured.
     """
-    api = _get_odido_api()
     if not api.is_configured:
         raise HTTPException(
             status_code=400,
             detail="Odido API credentials not configured. Set ODIDO_USER_ID and ODIDO_TOKEN environment variables or configure via /api/config",
         )
     try:
-        subscriptions = api.get_subscriptions()
-        return {"subscriptions": [s.as_dict() for s in subscriptions]}
+        subscriptions = await api.get_subscriptions()
+        return ORJSONResponse({"subscriptions": [s.as_dict() for s in subscriptions]})
     except OdidoAuthError as e:
         raise HTTPException(status_code=401, detail=str(e))
     except OdidoAPIError as e:
@@ -193,39 +216,47 @@ def get_odido_subscriptions(_: None = Depends(verify_api_key)):
 
 
 @app.get("/api/odido/remaining")
-def get_odido_remaining(_: None = Depends(verify_api_key)):
+async def get_odido_remaining(
+    api: OdidoAPI = Depends(_get_odido_api), _: None = Depends(verify_api_key)
+):
     """
     Get the remaining data balance from Odido.
     
     Returns the total remaining MB for the NL zone.
     Requires ODIDO_USER_ID and ODIDO_TOKEN to be configured.
     """
-    api = _get_odido_api()
     if not api.is_configured:
         raise HTTPException(
             status_code=400,
             detail="Odido API credentials not configured. Set ODIDO_USER_ID and ODIDO_TOKEN environment variables or configure via /api/config",
         )
     try:
-        remaining_mb = api.get_remaining_data_mb()
-        return {"remaining_mb": remaining_mb}
+        remaining_mb = await api.get_remaining_data_mb()
+        return ORJSONResponse({"remaining_mb": remaining_mb})
     except OdidoAuthError as e:
         raise HTTPException(status_code=401, detail=str(e))
     except OdidoAPIError as e:
         raise HTTPException(status_code=502, detail=str(e))
 
 
-def main():
-    scheduler.start()
-
-    def handle_signal(signum, frame):  # pragma: no cover
-        logger.info("Received signal %s, shutting down", signum)
-        scheduler.stop()
+def _server_backends() -> dict:
+    """Prefer uvloop and httptools when installed, otherwise uvicorn's pure-Python defaults."""
+    return {
+        "loop": "uvloop" if importlib.util.find_spec("uvloop") else "asyncio",
+        "http": "httptools" if importlib.util.find_spec("httptools") else "h11",
+    }
 
-    signal.signal(signal.SIGTERM, handle_signal)
-    signal.signal(signal.SIGINT, handle_signal)
 
-    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("PORT", 80)), log_level="info")
+def main():
+    # uvicorn handles SIGINT/SIGTERM and runs the shutdown event, which stops the scheduler.
+    uvicorn.run(
+        app,
+        host="0.0.0.0",
+        port=int(os.getenv("PORT", 80)),
+        log_level="info",
+        access_log=False,
+        **_server_backends(),
+    )
 
 
 if __name__ == "__main__":
@@ -9,24 +9,63 @@ This module provides functionality to:
 
 from __future__ import annotations
 
-import json
+import asyncio
 import logging
 import os
+import time
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
 
-import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+import httpx
+import orjson
+
+from .config import DEFAULT_BUNDLE_CODE
 
 logger = logging.getLogger("odido.api")
 
 ODIDO_BASE_URL = "https://capi.odido.nl"
 DEFAULT_USER_AGENT = "T-Mobile 5.3.28 (Android 10; 10)"
-DEFAULT_BUYING_CODE = "A0DAY01"
+# These are common bundle codes based on the reference projects
+# The actual available codes may vary based on the user's subscription
+AVAILABLE_BUNDLE_CODES: Tuple[str, ...] = (
+    "A0DAY01",  # 2GB daily bundle
+    "A0DAY05",  # 5GB daily bundle
+)
+# The API reports remaining bundle data in kilobytes.
+KB_PER_MB = 1024
+
+HTTP_TIMEOUT_SECONDS = 30.0
+MAX_RETRIES = 3
+RETRY_BACKOFF_SECONDS = 1.0
+RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+BUNDLE_CACHE_TTL_SECONDS = 30.0
+
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the shared HTTP client, creating it on first use."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            timeout=HTTP_TIMEOUT_SECONDS,
+            # requests followed redirects by default; httpx does not.
+            follow_redirects=True,
+            transport=httpx.AsyncHTTPTransport(retries=MAX_RETRIES),
+        )
+    return _http_client
+
+
+async def close_http_client() -> None:
+    """Close the shared HTTP client and release its connection pool."""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
 
 
-@dataclass
+@dataclass(slots=True)
 class Bundle:
     """Represents an Odido roaming bundle."""
 
@@ -46,7 +85,7 @@ class Bundle:
         }
 
 
-@dataclass
+@dataclass(slots=True)
 class Subscription:
     """Represents an Odido subscription."""
 
@@ -62,6 +101,18 @@ class Subscription:
         }
 
 
+def _bundle_from_record(record: Dict[str, Any]) -> Bundle:
+    """Build a Bundle from a raw API record, defaulting any missing fields."""
+    remaining_bytes = (record.get("Remaining") or {}).get("Value", 0)
+    return Bundle(
+        buying_code=record.get("BuyingCode", ""),
+        zone_color=record.get("ZoneColor", ""),
+        remaining_bytes=remaining_bytes,
+        remaining_mb=round(remaining_bytes / KB_PER_MB, 2),
+        description=record.get("Description"),
+    )
+
+
 class OdidoAPIError(Exception):
     """Base exception for Odido API errors."""
 
@@ -91,55 +142,75 @@ class OdidoAPI:
         """
         self.user_id = user_id or os.getenv("ODIDO_USER_ID")
         self.access_token = access_token or os.getenv("ODIDO_TOKEN")
+        self._subscriptions_url = f"{ODIDO_BASE_URL}/{self.user_id}/linkedsubscriptions"
 
-        self._session: Optional[requests.Session] = None
         self._subscription_url: Optional[str] = None
+        # Raw roaming bundle records per subscription URL, with their fetch time.
+        self._bundle_cache: Dict[str, Tuple[float, List[Dict[str, Any]]]] = {}
+
+    @property
+    def access_token(self) -> Optional[str]:
+        """The Odido access/bearer token."""
+        return self._access_token
+
+    @access_token.setter
+    def access_token(self, value: Optional[str]) -> None:
+        # Headers only depend on the token, so build them once per token change.
+        self._access_token = value
+        self._headers = {
+            "Authorization": f"Bearer {value}",
+            "User-Agent": DEFAULT_USER_AGENT,
+            "Accept": "application/json",
+        }
 
     @property
     def is_configured(self) -> bool:
         """Check if the API client has valid credentials configured."""
         return bool(self.user_id and self.access_token)
 
-    def _get_session(self) -> requests.Session:
-        """Get or create an HTTP session with retry configuration."""
-        if self._session is None:
-            self._session = requests.Session()
-            retry_strategy = Retry(
-                total=3,
-                backoff_factor=1,
-                status_forcelist=[429, 500, 502, 503, 504],
-            )
-            adapter = HTTPAdapter(max_retries=retry_strategy)
-            self._session.mount("https://", adapter)
-
-        # Set headers for each request
-        self._session.headers.update(
-            {
-                "Authorization": f"Bearer {self.access_token}",
-                "User-Agent": DEFAULT_USER_AGENT,
-                "Accept": "application/json",
-            }
-        )
-        return self._session
+    def _get_session(self) -> httpx.AsyncClient:
+        """Get the shared HTTP client used for all Odido API calls."""
+        return get_http_client()
 
-    def _handle_response(
-        self, response: requests.Response, require_json: bool = True
-    ) -> Dict[str, Any]:
+    async def _send(self, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        """
+        Send a request, retrying idempotent calls on throttling and server errors.
+
+        Connection failures are retried by the transport; ``GET`` requests are
+        additionally retried on retryable status codes with exponential backoff.
+        """
+        session = self._get_session()
+        headers = self._headers
+        attempts = MAX_RETRIES + 1 if method == "GET" else 1
+        for attempt in range(attempts):
+            try:
+                response = await session.request(method, url, headers=headers, **kwargs)
+            except httpx.HTTPError as e:
+                raise OdidoAPIError(f"Request failed: {e}") from e
+            if response.status_code not in RETRY_STATUS_CODES or attempt == attempts - 1:
+                return response
+            await asyncio.sleep(RETRY_BACKOFF_SECONDS * (2 ** attempt))
+        return response
+
+    def _handle_response(self, response: httpx.Response) -> Dict[str, Any]:
         """Handle API response and check for errors."""
-        if not response.ok:
-            logger.error(f"API request failed: {response.status_code} {response.reason}")
+        if not response.is_success:
+            logger.error(
+                "API request failed: %s %s", response.status_code, response.reason_phrase
+            )
             if response.status_code == 401:
                 raise OdidoAuthError("Invalid or expired access token")
-            raise OdidoAPIError(f"API error: {response.status_code} {response.reason}")
+            raise OdidoAPIError(f"API error: {response.status_code} {response.reason_phrase}")
 
+        content = response.content
+        if not content:
+            return {}
         try:
-            return response.json()
-        except json.JSONDecodeError:
-            if require_json:
-                raise OdidoAPIError(f"Expected JSON response, got: {response.text}")
-            return {"raw": response.text}
+            return orjson.loads(content)
+        except orjson.JSONDecodeError:
+            raise OdidoAPIError(f"Expected JSON response, got: {response.text}")
 
-    def get_subscriptions(self) -> List[Subscription]:
+    async def get_subscriptions(self) -> List[Subscription]:
         """
         Fetch the user's subscriptions.
 
@@ -149,12 +220,9 @@ class OdidoAPI:
         if not self.is_configured:
             raise OdidoAPIError("API client not configured with credentials")
 
-        session = self._get_session()
         logger.info("Fetching subscription details...")
 
-        response = session.get(
-            f"{ODIDO_BASE_URL}/{self.user_id}/linkedsubscriptions"
-        )
+        response = await self._send("GET", self._subscriptions_url)
         data = self._handle_response(response)
 
         subscriptions = []
@@ -171,17 +239,14 @@ class OdidoAPI:
 
         return subscriptions
 
-    def get_roaming_bundles(
+    async def _fetch_roaming_bundle_data(
         self, subscription_url: Optional[str] = None
-    ) -> List[Bundle]:
+    ) -> List[Dict[str, Any]]:
         """
-        Fetch roaming bundle information for a subscription.
-
-        Args:
-            subscription_url: The subscription URL, or uses the first subscription
+        Fetch the raw roaming bundle records for a subscription.
 
-        Returns:
-            List of Bundle objects
+        Results are cached per subscription for ``BUNDLE_CACHE_TTL_SECONDS`` so
+        that the scheduler and the API endpoints share one upstream call.
         """
         if not self.is_configured:
             raise OdidoAPIError("API client not configured with credentials")
@@ -189,34 +254,56 @@ class OdidoAPI:
         url = subscription_url or self._subscription_url
         if not url:
             # Fetch subscriptions first to get the URL
-            subs = self.get_subscriptions()
+            subs = await self.get_subscriptions()
             if not subs:
                 raise OdidoAPIError("No subscriptions found")
             url = subs[0].subscription_url
 
-        session = self._get_session()
+        cached = self._bundle_cache.get(url)
+        if cached is not None and time.monotonic() - cached[0] < BUNDLE_CACHE_TTL_SECONDS:
+            return cached[1]
+
         logger.info("Fetching roaming bundle information...")
 
-        response = session.get(f"{url}/roamingbundles")
-        data = self._handle_response(response)
+        response = await self._send("GET", f"{url}/roamingbundles")
+        bundles = self._handle_response(response).get("Bundles", [])
+        self._bundle_cache[url] = (time.monotonic(), bundles)
+        return bundles
 
-        bundles = []
-        for bundle in data.get("Bundles", []):
-            remaining = bundle.get("Remaining", {})
-            remaining_bytes = remaining.get("Value", 0)
-            bundles.append(
-                Bundle(
-                    buying_code=bundle.get("BuyingCode", ""),
-                    zone_color=bundle.get("ZoneColor", ""),
-                    remaining_bytes=remaining_bytes,
-                    remaining_mb=round(remaining_bytes / 1024, 2),
-                    description=bundle.get("Description"),
-                )
-            )
+    def invalidate(self) -> None:
+        """Drop cached bundle data so the next read hits the API."""
+        self._bundle_cache.clear()
 
-        return bundles
+    async def get_roaming_bundles(
+        self, subscription_url: Optional[str] = None
+    ) -> List[Bundle]:
+        """
+        Fetch roaming bundle information for a subscription.
 
-    def get_remaining_data_mb(
+        Args:
+            subscription_url: The subscription URL, or uses the first subscription
+
+        Returns:
+            List of Bundle objects
+        """
+        records = await self._fetch_roaming_bundle_data(subscription_url)
+        try:
+            return [
+                Bundle(
+                    buying_code=record["BuyingCode"],
+                    zone_color=record["ZoneColor"],
+                    remaining_bytes=(remaining := record["Remaining"]["Value"]),
+                    remaining_mb=round(remaining / KB_PER_MB, 2),
+                    description=record.get("Description"),
+                )
+                for record in records
+            ]
+        except (KeyError, TypeError):
+            # Schema drift: a record is missing fields, so parse each one leniently.
+            logger.warning("Unexpected roaming bundle record shape; using defaults")
+            return [_bundle_from_record(record) for record in records]
+
+    async def get_remaining_data_mb(
         self, subscription_url: Optional[str] = None, zone_color: str = "NL"
     ) -> float:
         """
@@ -229,15 +316,17 @@ class OdidoAPI:
         Returns:
             Total remaining MB for the specified zone
         """
-        bundles = self.get_roaming_bundles(subscription_url)
+        bundles = await self._fetch_roaming_bundle_data(subscription_url)
         total_bytes = sum(
-            b.remaining_bytes for b in bundles if b.zone_color == zone_color
+            bundle.get("Remaining", {}).get("Value", 0)
+            for bundle in bundles
+            if bundle.get("ZoneColor", "") == zone_color
         )
-        return round(total_bytes / 1024, 2)
+        return round(total_bytes / KB_PER_MB, 2)
 
-    def buy_bundle(
+    async def buy_bundle(
         self,
-        buying_code: str = DEFAULT_BUYING_CODE,
+        buying_code: str = DEFAULT_BUNDLE_CODE,
         subscription_url: Optional[str] = None,
     ) -> Dict[str, Any]:
         """
@@ -255,25 +344,25 @@ class OdidoAPI:
 
         url = subscription_url or self._subscription_url
         if not url:
-            subs = self.get_subscriptions()
+            subs = await self.get_subscriptions()
             if not subs:
                 raise OdidoAPIError("No subscriptions found")
             url = subs[0].subscription_url
 
-        session = self._get_session()
-        logger.info(f"Purchasing bundle with code: {buying_code}")
+        logger.info("Purchasing bundle with code: %s", buying_code)
 
         payload = {"Bundles": [{"BuyingCode": buying_code}]}
-        response = session.post(f"{url}/roamingbundles", json=payload)
+        response = await self._send("POST", f"{url}/roamingbundles", json=payload)
 
         # Note: Odido API returns 202 for successful bundle purchase
         if response.status_code == 202:
-            logger.info(f"Successfully requested bundle purchase: {buying_code}")
+            logger.info("Successfully requested bundle purchase: %s", buying_code)
+            self.invalidate()
             return {"success": True, "buying_code": buying_code}
 
-        return self._handle_response(response, require_json=False)
+        return self._handle_response(response)
 
-    def get_available_bundle_codes(self) -> List[str]:
+    def get_available_bundle_codes(self) -> Tuple[str, ...]:
         """
         Get a list of known available bundle codes.
 
@@ -282,11 +371,18 @@ class OdidoAPI:
         implementations.
 
         Returns:
-            List of known bundle buying codes
+            Tuple of known bundle buying codes
         """
-        # These are common bundle codes based on the reference projects
-        # The actual available codes may vary based on the user's subscription
-        return [
-            "A0DAY01",  # 2GB daily bundle
-            "A0DAY05",  # 5GB daily bundle
-        ]
+        return AVAILABLE_BUNDLE_CODES
+
+
+@lru_cache(maxsize=4)
+def get_odido_api(user_id: Optional[str], access_token: Optional[str]) -> OdidoAPI:
+    """
+    Return a shared API client for the given credentials.
+
+    Clients are cheap credential holders; all of them send requests through
+    the shared HTTP client from ``get_http_client``. Call ``get_odido_api.cache_clear()`` when the
+    configured credentials change.
+    """
+    return OdidoAPI(user_id=user_id, access_token=access_token)
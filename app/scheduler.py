@@ -1,72 +1,101 @@
 from __future__ import annotations
 
-import threading
+import asyncio
 import time
 from typing import Optional
 
 from .service import BundleService
 
+# Lower bound on the retry delay after a failed cycle, so a persistent error cannot spin the loop.
+FAILED_CYCLE_RETRY_SECONDS = 30.0
+
 
 class Scheduler:
     def __init__(self, service: BundleService) -> None:
         self.service = service
-        self.thread: Optional[threading.Thread] = None
-        self._stop = threading.Event()
-        self._last_sync_ts: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        # Created in start() so it belongs to the loop that runs the task.
+        self._stop: Optional[asyncio.Event] = None
+        # Monotonic time of the last sync; -inf makes the first iteration sync.
+        self._last_sync_ts: float = float("-inf")
 
     def start(self) -> None:
-        if self.thread and self.thread.is_alive():
+        """Start the scheduler as a task on the running event loop."""
+        if self.task and not self.task.done():
             return
-        self.thread = threading.Thread(target=self._run_loop, daemon=True)
-        self.thread.start()
+        self._stop = asyncio.Event()
+        self.task = asyncio.get_running_loop().create_task(self.run_async())
 
-    def stop(self) -> None:
-        self._stop.set()
-        if self.thread:
-            self.thread.join(timeout=5)
+    async def stop(self) -> None:
+        if self._stop is not None:
+            self._stop.set()
+        if self.task:
+            # Shutdown must go on to close the HTTP client and storage whatever the task did.
+            try:
+                await asyncio.wait_for(self.task, timeout=5)
+            except asyncio.TimeoutError:
+                pass
+            except asyncio.CancelledError:
+                if not self.task.cancelled():
+                    raise
+            except Exception as exc:  # pragma: no cover - defensive logging
+                self.service._log("ERROR", f"Scheduler task failed: {exc}")
 
-    def _run_loop(self) -> None:
-        first_cycle = True
-        while not self._stop.is_set():
-            now = time.time()
-            should_sync = (
-                first_cycle
-                or self.service.state.remaining_mb == 0
-                or self._last_sync_ts is None
-                or (now - self._last_sync_ts) >= 300
-            )
-            if should_sync:
-                self._sync_remaining_from_api()
-                first_cycle = False
+    async def run_async(self) -> None:
+        # Bind hot lookups once; the service keeps the same state object for its lifetime.
+        run_check_cycle = self.service.run_check_cycle
+        state = self.service.state
+        stop_wait = self._stop.wait
+        is_stopped = self._stop.is_set
+        monotonic = time.monotonic
+        wall_time = time.time
+        wait_for = asyncio.wait_for
+
+        while not is_stopped():
+            try:
+                if monotonic() - self._last_sync_ts >= 300 or state.remaining_mb == 0:
+                    await self._sync_remaining_from_api()
 
-            result = self.service.run_check_cycle()
-            sleep_seconds = result["next_interval_minutes"] * 60
-            reset_ts = self.service.state.next_reset_ts
-            now = time.time()
-            if reset_ts:
-                until_reset = max(reset_ts - now, 0)
-                sleep_seconds = min(sleep_seconds, until_reset)
-            self._stop.wait(timeout=sleep_seconds)
+                result = await run_check_cycle()
+                sleep_seconds = result["next_interval_minutes"] * 60
+                reset_ts = state.next_reset_ts
+                if reset_ts:
+                    # next_reset_ts is a persisted wall-clock timestamp.
+                    until_reset = max(reset_ts - wall_time(), 0)
+                    sleep_seconds = min(sleep_seconds, until_reset)
+            except Exception as exc:
+                # Keep the scheduler alive; retry after the shortest check interval. The
+                # reset clamp is skipped here: a cycle that failed before moving
+                # next_reset_ts forward would otherwise retry immediately, forever.
+                self.service._log("ERROR", f"Scheduler check cycle failed: {exc}")
+                sleep_seconds = max(
+                    self.service.config.min_check_interval_minutes * 60,
+                    FAILED_CYCLE_RETRY_SECONDS,
+                )
+            try:
+                await wait_for(stop_wait(), timeout=sleep_seconds)
+            except asyncio.TimeoutError:
+                pass
 
-    def _sync_remaining_from_api(self) -> None:
+    async def _sync_remaining_from_api(self) -> None:
         try:
             api = self.service._get_odido_api()
         except Exception as exc:  # pragma: no cover - defensive logging
             self.service._log(
                 "ERROR", f"Failed to initialize Odido API client for sync: {exc}"
             )
-            self._last_sync_ts = time.time()
+            self._last_sync_ts = time.monotonic()
             return
 
         if not api.is_configured:
             self.service._log(
                 "INFO", "Odido API not configured - skipping remaining data sync"
             )
-            self._last_sync_ts = time.time()
+            self._last_sync_ts = time.monotonic()
             return
 
         try:
-            remaining_mb = api.get_remaining_data_mb()
+            remaining_mb = await api.get_remaining_data_mb()
             with self.service._lock:
                 self.service.state.remaining_mb = remaining_mb
                 self.service.storage.save_state(self.service.state)
@@ -78,4 +107,4 @@ class Scheduler:
                 "ERROR", f"Failed to sync remaining data from Odido API: {exc}"
             )
         finally:
-            self._last_sync_ts = time.time()
+            self._last_sync_ts = time.monotonic()
@@ -1,7 +1,10 @@
 from __future__ import annotations
 
+import asyncio
 import logging
+import math
 import os
+import random
 import time
 import threading
 from datetime import datetime, timedelta
@@ -9,29 +12,68 @@ from typing import Any, Dict, Optional
 
 from .config import AppConfig, BundleState
 from .estimator import ConsumptionEstimator
+from .odido_api import OdidoAPI, OdidoAPIError, OdidoAuthError, get_odido_api
 from .storage import Storage
 
 logger = logging.getLogger("odido.service")
 
+PRUNE_INTERVAL_SECONDS = 3600
+
+
+class RenewalError(Exception):
+    """Base exception for failed bundle renewals."""
+
+    pass
+
+
+class RenewalPermanentError(RenewalError):
+    """Renewal failed in a way that retrying cannot fix."""
+
+    pass
+
+
+class RenewalTransientError(RenewalError):
+    """Renewal failed but may succeed on a later attempt."""
+
+    pass
+
 
 class BundleService:
     def __init__(self, storage: Storage) -> None:
         self.storage = storage
         self.config = storage.load_config()
         self.state = storage.load_state()
-        self.estimator = ConsumptionEstimator(
-            window_minutes=self.config.estimator_window_minutes,
-            max_events=self.config.estimator_max_events,
-        )
+        self.estimator = self._build_estimator()
         self._lock = threading.Lock()
+        self._last_prune_ts = 0.0
         self._ensure_reset_schedule()
         self._log("INFO", "Service initialized")
 
+    def _persisted_levelno(self) -> int:
+        """Lowest level written to the log table, from ``config.log_level``."""
+        levelno = logging.getLevelName(str(self.config.log_level).upper())
+        return levelno if isinstance(levelno, int) else logging.INFO
+
+    def _log_enabled(self, levelno: int) -> bool:
+        """Whether a message at ``levelno`` would be persisted or emitted at all."""
+        return levelno >= self._persisted_levelno() or logger.isEnabledFor(levelno)
+
     def _log(self, level: str, message: str) -> None:
         ts = time.time()
-        self.storage.append_log(ts, level, message)
+        if logging.getLevelName(level) >= self._persisted_levelno():
+            self.storage.append_log(ts, level, message)
         getattr(logger, level.lower(), logger.info)(message)
 
+    def _build_estimator(self) -> ConsumptionEstimator:
+        """Create an estimator seeded with the persisted usage inside its window."""
+        window_start = time.time() - (self.config.estimator_window_minutes * 60)
+        return ConsumptionEstimator(
+            window_minutes=self.config.estimator_window_minutes,
+            max_events=self.config.estimator_max_events,
+            # Only the newest max_events rows can survive in the estimator's window.
+            events=self.storage.recent_usage(window_start, self.config.estimator_max_events),
+        )
+
     def _ensure_reset_schedule(self) -> None:
         if not self.state.next_reset_ts:
             self.state.next_reset_ts = self._next_midnight_ts()
@@ -48,10 +90,12 @@ class BundleService:
         with self._lock:
             self.config.update_from_dict(data)
             self.storage.save_config(self.config)
-            self.estimator = ConsumptionEstimator(
-                window_minutes=self.config.estimator_window_minutes,
-                max_events=self.config.estimator_max_events,
-            )
+            # The estimator tracks usage incrementally; only rescan storage when its window changes.
+            if (
+                self.estimator.window_minutes != self.config.estimator_window_minutes
+                or self.estimator.max_events != self.config.estimator_max_events
+            ):
+                self.estimator = self._build_estimator()
             self._log("INFO", "Configuration updated")
             return self.config
 
@@ -59,18 +103,24 @@ class BundleService:
         now_ts = time.time()
         if self.state.next_reset_ts and now_ts >= self.state.next_reset_ts:
             self.state.used_today_mb = 0.0
-            self.state.next_reset_ts = self._next_midnight_ts()
+            next_reset_ts = self.state.next_reset_ts + 86400.0
+            local = time.localtime(next_reset_ts)
+            if next_reset_ts <= now_ts or local.tm_hour or local.tm_min or local.tm_sec:
+                # Missed days or crossed a DST change: realign to the coming local midnight.
+                next_reset_ts = self._next_midnight_ts()
+            self.state.next_reset_ts = next_reset_ts
             self.storage.save_state(self.state)
             self._log("INFO", "Daily usage reset")
 
     def simulate_usage(self, amount_mb: float, ts: Optional[float] = None) -> BundleState:
         ts = ts or time.time()
-        with self._lock:
+        with self._lock, self.storage.transaction():
             self._apply_daily_reset_if_needed()
             self.state.used_today_mb += amount_mb
             self.state.total_used_mb += amount_mb
             self.state.remaining_mb = max(self.state.remaining_mb - amount_mb, 0.0)
             self.storage.record_usage(ts, amount_mb)
+            self.estimator.add_event(ts, amount_mb)
             self.storage.save_state(self.state)
             self._log("INFO", f"Usage recorded: {amount_mb} MB")
             return self.state
@@ -78,11 +128,10 @@ class BundleService:
     def manual_add_bundle(self, amount_mb: Optional[float], idempotency_key: Optional[str]) -> BundleState:
         amount = amount_mb if amount_mb is not None else self.config.bundle_size_mb
         key = idempotency_key or f"manual-{int(time.time())}-{amount}"
-        with self._lock:
-            if self.storage.has_idempotency(key):
+        with self._lock, self.storage.transaction():
+            if not self.storage.try_register_idempotency(key, "manual_add", time.time()):
                 self._log("INFO", f"Idempotent add ignored for key {key}")
                 return self.state
-            self.storage.register_idempotency(key, "manual_add", time.time())
             self._add_bundle(amount)
             self._log("INFO", f"Bundle added manually: {amount} MB")
             return self.state
@@ -90,73 +139,85 @@ class BundleService:
     def _add_bundle(self, amount: float) -> None:
         self.state.remaining_mb += amount
         if not self.state.expiry_ts:
-            self.state.expiry_ts = (datetime.now() + timedelta(hours=self.config.default_bundle_valid_hours)).timestamp()
+            self.state.expiry_ts = time.time() + self.config.default_bundle_valid_hours * 3600.0
         self.storage.save_state(self.state)
 
-    def _get_odido_api(self):
-        """Create an Odido API client using configured credentials."""
-        from .odido_api import OdidoAPI
-        return OdidoAPI(
-            user_id=self.config.odido_user_id or os.getenv("ODIDO_USER_ID"),
-            access_token=self.config.odido_token or os.getenv("ODIDO_TOKEN"),
+    def _get_odido_api(self) -> OdidoAPI:
+        """Return the shared Odido API client for the configured credentials."""
+        return get_odido_api(
+            self.config.odido_user_id or os.getenv("ODIDO_USER_ID"),
+            self.config.odido_token or os.getenv("ODIDO_TOKEN"),
         )
 
-    def _renew_with_real_api(self) -> bool:
-        """Attempt to renew bundle using the real Odido API."""
-        from .odido_api import OdidoAPIError, OdidoAuthError
-        
+    async def _renew_with_real_api(self) -> None:
+        """
+        Attempt to renew bundle using the real Odido API.
+
+        Raises:
+            RenewalPermanentError: Retrying cannot help (missing or rejected credentials)
+            RenewalTransientError: The attempt failed but a later one may succeed
+        """
         api = self._get_odido_api()
         if not api.is_configured:
-            self._log("ERROR", "Odido API not configured - auto-renewal disabled. Set ODIDO_USER_ID and ODIDO_TOKEN environment variables")
-            return False
-        
+            raise RenewalPermanentError(
+                "Odido API not configured - auto-renewal disabled. Set ODIDO_USER_ID and ODIDO_TOKEN environment variables"
+            )
+
+        buying_code = self.config.bundle_code
         try:
-            buying_code = self.config.bundle_code
-            result = api.buy_bundle(buying_code=buying_code)
-            if result.get("success"):
-                self._log("INFO", f"Bundle purchased via Odido API with code: {buying_code}")
-                # Update local state with the configured bundle size
-                with self._lock:
-                    self._add_bundle(self.config.bundle_size_mb)
-                return True
-            else:
-                self._log("WARNING", f"Odido API purchase returned unexpected result: {result}")
-                return False
+            result = await api.buy_bundle(buying_code=buying_code)
         except OdidoAuthError as e:
-            self._log("ERROR", f"Odido API authentication failed: {e}")
-            return False
+            raise RenewalPermanentError(f"Odido API authentication failed: {e}") from e
         except OdidoAPIError as e:
-            self._log("ERROR", f"Odido API error: {e}")
-            return False
-        except Exception as e:
-            self._log("ERROR", f"Unexpected error during Odido API renewal: {e}")
-            return False
+            raise RenewalTransientError(f"Odido API error: {e}") from e
+        if not result.get("success"):
+            raise RenewalTransientError(f"Odido API purchase returned unexpected result: {result}")
 
-    def _renew_with_retry(self) -> None:
+        self._log("INFO", f"Bundle purchased via Odido API with code: {buying_code}")
+        # Update local state with the configured bundle size
+        with self._lock:
+            self._add_bundle(self.config.bundle_size_mb)
+
+    async def _renew_with_retry(self) -> None:
         """
-        Attempt to renew bundle via the Odido API with up to 3 retries using exponential backoff.
-        
-        Returns without action if all attempts fail. Check logs for error details.
+        Attempt to renew bundle via the Odido API with up to 3 retries using jittered exponential backoff.
+
+        Permanent failures stop immediately. Returns without action if all attempts fail; check logs for error details.
         """
         retries = 3
         backoff = 2
-        
+
         for attempt in range(retries):
             try:
-                if self._renew_with_real_api():
-                    return
-            except Exception as exc:  # pragma: no cover
+                await self._renew_with_real_api()
+                return
+            except RenewalPermanentError as exc:
+                self._log("ERROR", f"{exc} - not retrying")
+                return
+            except Exception as exc:
                 self._log("ERROR", f"Renewal attempt {attempt+1} failed: {exc}")
-            
+
             if attempt < retries - 1:
-                time.sleep(backoff ** attempt)
-        
+                # Jitter keeps several instances from retrying in lockstep.
+                await asyncio.sleep(backoff ** attempt * (0.5 + random.random()))
+
         self._log("ERROR", "All renewal attempts failed - check Odido API credentials and network connectivity")
 
-    def compute_consumption_rate(self) -> float:
-        window_start = time.time() - (self.config.estimator_window_minutes * 60)
-        usage_events = self.storage.recent_usage(window_start)
-        return self.estimator.rate_mb_per_minute(usage_events)
+    async def _prune_history_if_due(self) -> None:
+        """Drop usage and log rows older than any window still read, at most hourly."""
+        with self._lock:
+            now_ts = time.time()
+            if now_ts - self._last_prune_ts < PRUNE_INTERVAL_SECONDS:
+                return
+            self._last_prune_ts = now_ts
+            retention_minutes = max(
+                self.config.estimator_window_minutes, self.config.log_retention_minutes
+            )
+        # Pruning can delete a large backlog; keep it off the event loop and out of the service lock.
+        await asyncio.to_thread(self.storage.prune, now_ts - retention_minutes * 60)
+
+    def compute_consumption_rate(self, now: Optional[float] = None) -> float:
+        return self.estimator.rate_mb_per_minute(now)
 
     def estimated_time_to_depletion_minutes(self, rate: float) -> Optional[float]:
         if rate <= 0:
@@ -164,15 +225,11 @@ class BundleService:
         return self.state.remaining_mb / rate
 
     def compute_next_check_minutes(self, rate: float) -> float:
-        if rate <= 0:
-            return float(self.config.max_check_interval_minutes)
-        eta = self.estimated_time_to_depletion_minutes(rate)
-        if eta is None:
-            return float(self.config.max_check_interval_minutes)
-        interval = eta / 4
-        interval = max(float(self.config.min_check_interval_minutes), interval)
-        interval = min(float(self.config.max_check_interval_minutes), interval)
-        return interval
+        eta = self.state.remaining_mb / rate if rate > 0 else math.inf
+        return min(
+            float(self.config.max_check_interval_minutes),
+            max(float(self.config.min_check_interval_minutes), eta / 4),
+        )
 
     def should_auto_renew(self, rate: float) -> bool:
         if not self.config.auto_renew_enabled:
@@ -184,31 +241,37 @@ class BundleService:
             return True
         return False
 
-    def run_check_cycle(self) -> Dict[str, Any]:
-        with self._lock:
+    async def run_check_cycle(self) -> Dict[str, Any]:
+        # One timestamp for the whole cycle keeps the rate and the recorded check times consistent.
+        now = time.time()
+        with self._lock, self.storage.transaction():
             self._apply_daily_reset_if_needed()
-            rate = self.compute_consumption_rate()
+            rate = self.compute_consumption_rate(now)
             eta = self.estimated_time_to_depletion_minutes(rate)
             should_renew = self.should_auto_renew(rate)
 
         if should_renew:
-            self._renew_with_retry()
+            await self._renew_with_retry()
+            # Retries may have slept for several seconds.
+            now = time.time()
             with self._lock:
                 eta = self.estimated_time_to_depletion_minutes(rate)
 
-        with self._lock:
+        with self._lock, self.storage.transaction():
             next_interval_minutes = self.compute_next_check_minutes(rate)
-            next_check_ts = time.time() + (next_interval_minutes * 60)
-            self.state.last_check_ts = time.time()
-            self.state.next_check_ts = next_check_ts
-            self.state.estimated_depletion_ts = (time.time() + eta * 60) if eta else None
+            self.state.last_check_ts = now
+            self.state.next_check_ts = now + (next_interval_minutes * 60)
+            self.state.estimated_depletion_ts = (now + eta * 60) if eta else None
             self.storage.save_state(self.state)
-            self._log("DEBUG", f"Check completed. Rate={rate:.3f} MB/min interval={next_interval_minutes} minutes")
-            return {
-                "rate": rate,
-                "eta_minutes": eta,
-                "next_interval_minutes": next_interval_minutes,
-            }
+            if self._log_enabled(logging.DEBUG):
+                self._log("DEBUG", f"Check completed. Rate={rate:.3f} MB/min interval={next_interval_minutes} minutes")
+
+        await self._prune_history_if_due()
+        return {
+            "rate": rate,
+            "eta_minutes": eta,
+            "next_interval_minutes": next_interval_minutes,
+        }
 
     def status(self) -> Dict[str, Any]:
         rate = self.compute_consumption_rate()
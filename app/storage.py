@@ -1,33 +1,97 @@
 from __future__ import annotations
 
-import json
+import atexit
+import logging
 import os
+import queue
 import sqlite3
 import threading
 from contextlib import contextmanager
 from pathlib import Path
-from typing import List, Tuple
+from typing import Dict, List, Tuple
+
+import orjson
 
 from .config import AppConfig, BundleState, load_initial_config
 
+logger = logging.getLogger("odido.storage")
+
 DB_PATH = os.getenv("APP_DB_PATH", "/data/odido.db")
+# Queued log rows are written at least this often, or sooner once the batch fills.
+LOG_FLUSH_INTERVAL_SECONDS = 0.5
+LOG_FLUSH_BATCH_SIZE = 100
+# The logs table is a ring buffer: row ids cycle through this many slots.
+LOG_RING_SIZE = 10_000
+# prune() deletes rows and frees pages in chunks of this size, one short write each.
+PRUNE_BATCH_SIZE = 1000
+
+# Hot statements are kept as constants so every call reuses the same text and
+# hits each connection's sqlite3 statement cache.
+SQL_SELECT_KV = "SELECT value FROM kv WHERE key=?"
+SQL_UPSERT_KV = (
+    "INSERT INTO kv(key, value) VALUES(?, ?) "
+    "ON CONFLICT(key) DO UPDATE SET value=excluded.value"
+)
+SQL_INSERT_USAGE = "INSERT INTO usage_events(ts, amount_mb) VALUES(?, ?)"
+SQL_SELECT_USAGE_SINCE = (
+    "SELECT ts, amount_mb FROM usage_events WHERE ts >= ? ORDER BY ts DESC LIMIT ?"
+)
+SQL_SELECT_USAGE_LATEST = "SELECT ts, amount_mb FROM usage_events ORDER BY ts DESC LIMIT ?"
+SQL_INSERT_LOG = "INSERT OR REPLACE INTO logs(id, ts, level, message) VALUES(?, ?, ?, ?)"
+SQL_SELECT_LOGS = "SELECT ts, level, message FROM logs ORDER BY ts DESC LIMIT ?"
+SQL_REGISTER_IDEMPOTENCY = (
+    "INSERT INTO idempotency(key, created_ts, note) VALUES(?, ?, ?) "
+    "ON CONFLICT(key) DO NOTHING RETURNING 1"
+)
 
 
 class Storage:
+    """
+    SQLite-backed persistence, safe to share between threads.
+
+    Each thread lazily opens and keeps its own autocommit connection. Reads run
+    on it directly, so under WAL they never wait for writers; writes and
+    transactions are additionally serialized by ``_lock``. Log rows are queued
+    and written by a background thread, so ``recent_logs`` may trail the most
+    recent ``append_log`` calls while a writer holds the lock.
+    """
+
     def __init__(self, db_path: str = DB_PATH) -> None:
         self.db_path = db_path
-        self._lock = threading.Lock()
+        # Re-entrant so writes issued inside transaction() can take the lock again.
+        self._lock = threading.RLock()
         Path(os.path.dirname(db_path)).mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        # Last value written per kv key, so unchanged saves can be skipped.
+        self._persisted: Dict[str, dict] = {}
         self._init_db()
+        self._next_log_id = self._initial_log_id()
+
+        self._log_queue: "queue.SimpleQueue[Tuple[float, str, str]]" = queue.SimpleQueue()
+        # Rows taken off the queue but not yet committed; guarded by _lock.
+        self._log_pending: List[Tuple[float, str, str]] = []
+        self._log_wakeup = threading.Event()
+        self._closed = threading.Event()
+        self._start_log_flusher()
+        atexit.register(self.close)
+
+    def _start_log_flusher(self) -> None:
+        self._log_flusher = threading.Thread(
+            target=self._log_flush_loop, name="odido-log-flusher", daemon=True
+        )
+        self._log_flusher.start()
 
     def _init_db(self) -> None:
         with self._connect() as conn:
+            # Only takes effect for new databases; lets prune() hand pages back to the OS.
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL;")
             conn.execute("PRAGMA journal_mode=WAL;")
             conn.execute(
                 """
                 CREATE TABLE IF NOT EXISTS kv (
                     key TEXT PRIMARY KEY,
-                    value TEXT NOT NULL
+                    value BLOB NOT NULL
                 )
                 """
             )
@@ -50,6 +114,8 @@ class Storage:
                 )
                 """
             )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_usage_ts ON usage_events(ts DESC)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_logs_ts ON logs(ts DESC)")
             conn.execute(
                 """
                 CREATE TABLE IF NOT EXISTS idempotency (
@@ -59,35 +125,105 @@ class Storage:
                 )
                 """
             )
-            conn.commit()
         if self._load_raw("config") is None:
             self.save_config(load_initial_config())
         if self._load_raw("state") is None:
             self.save_state(BundleState())
 
+    def _initial_log_id(self) -> int:
+        """Resume the log ring at the slot after the newest row."""
+        with self._read() as conn:
+            row = conn.execute("SELECT id FROM logs ORDER BY ts DESC, id DESC LIMIT 1").fetchone()
+        return (row[0] + 1) % LOG_RING_SIZE if row else 0
+
+    def _thread_conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # check_same_thread is off only so close() can close every connection.
+            conn = sqlite3.connect(
+                self.db_path, timeout=30, check_same_thread=False, isolation_level=None
+            )
+            conn.execute("PRAGMA synchronous=NORMAL;")
+            conn.execute("PRAGMA temp_store=MEMORY;")
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
     @contextmanager
     def _connect(self):
+        """Yield this thread's connection for writing."""
         with self._lock:
-            conn = sqlite3.connect(self.db_path, timeout=30)
+            yield self._thread_conn()
+
+    @contextmanager
+    def _read(self):
+        """Yield this thread's connection for reading, without taking the write lock."""
+        yield self._thread_conn()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Group every write made inside the block into a single commit.
+
+        Nested use joins the outer transaction. On error, including a failed
+        COMMIT, the whole block is rolled back.
+        """
+        with self._lock:
+            conn = self._thread_conn()
+            if conn.in_transaction:
+                yield conn
+                return
+            conn.execute("BEGIN IMMEDIATE")
             try:
                 yield conn
-            finally:
+                conn.execute("COMMIT")
+            except BaseException:
+                # SQLite may already have rolled back, e.g. after SQLITE_FULL on COMMIT.
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                # Writes made in this block were discarded, so forget what they stored.
+                self._persisted.clear()
+                raise
+
+    def open(self) -> None:
+        """Restart the log flusher after ``close()``; does nothing while already open."""
+        with self._lock:
+            if not self._closed.is_set():
+                return
+            self._closed.clear()
+            self._log_wakeup.clear()
+            self._start_log_flusher()
+
+    def close(self) -> None:
+        """Stop the log flusher, write any queued log rows and close the database."""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._log_wakeup.set()
+        self._log_flusher.join(timeout=5)
+        self.flush_logs()
+        with self._lock:
+            for conn in self._connections:
                 conn.close()
+            self._connections.clear()
+            # Every thread opens a fresh connection on its next use, so the
+            # instance can be reopened (e.g. by a second app lifespan).
+            self._local = threading.local()
 
     def _load_raw(self, key: str):
-        with self._connect() as conn:
-            cur = conn.execute("SELECT value FROM kv WHERE key=?", (key,))
+        with self._read() as conn:
+            cur = conn.execute(SQL_SELECT_KV, (key,))
             row = cur.fetchone()
-            return json.loads(row[0]) if row else None
+            # orjson reads both BLOB rows and TEXT rows written by older versions.
+            return orjson.loads(row[0]) if row else None
 
     def _save_raw(self, key: str, value: dict) -> None:
-        payload = json.dumps(value)
         with self._connect() as conn:
-            conn.execute(
-                "INSERT INTO kv(key, value) VALUES(?, ?) ON CONFLICT(key) DO UPDATE SET value=excluded.value",
-                (key, payload),
-            )
-            conn.commit()
+            if self._persisted.get(key) == value:
+                return
+            conn.execute(SQL_UPSERT_KV, (key, orjson.dumps(value)))
+            self._persisted[key] = value
 
     def load_config(self) -> AppConfig:
         data = self._load_raw("config")
@@ -109,53 +245,108 @@ class Storage:
 
     def record_usage(self, ts: float, amount: float) -> None:
         with self._connect() as conn:
-            conn.execute(
-                "INSERT INTO usage_events(ts, amount_mb) VALUES(?, ?)",
-                (ts, amount),
-            )
-            conn.commit()
+            conn.execute(SQL_INSERT_USAGE, (ts, amount))
 
-    def recent_usage(self, since_ts: float) -> List[Tuple[float, float]]:
-        with self._connect() as conn:
-            cur = conn.execute(
-                "SELECT ts, amount_mb FROM usage_events WHERE ts >= ? ORDER BY ts DESC",
-                (since_ts,),
-            )
+    def recent_usage(self, since_ts: float, limit: int = -1) -> List[Tuple[float, float]]:
+        """Return usage since ``since_ts``, newest first; a negative ``limit`` means no limit."""
+        with self._read() as conn:
+            cur = conn.execute(SQL_SELECT_USAGE_SINCE, (since_ts, limit))
             return cur.fetchall()
 
     def recent_usage_by_limit(self, limit: int) -> List[Tuple[float, float]]:
-        with self._connect() as conn:
-            cur = conn.execute(
-                "SELECT ts, amount_mb FROM usage_events ORDER BY ts DESC LIMIT ?",
-                (limit,),
-            )
+        with self._read() as conn:
+            cur = conn.execute(SQL_SELECT_USAGE_LATEST, (limit,))
             return cur.fetchall()
 
     def append_log(self, ts: float, level: str, message: str) -> None:
-        with self._connect() as conn:
-            conn.execute(
-                "INSERT INTO logs(ts, level, message) VALUES(?, ?, ?)",
-                (ts, level, message),
-            )
-            conn.commit()
+        """Queue a log row; the background flusher writes queued rows in batches."""
+        self._log_queue.put((ts, level, message))
+        if self._log_queue.qsize() >= LOG_FLUSH_BATCH_SIZE:
+            self._log_wakeup.set()
+
+    def flush_logs(self, blocking: bool = True) -> None:
+        """
+        Write all queued log rows in a single transaction.
+
+        Rows stay pending until the commit succeeds, so a failed write is
+        retried by the next flush. With ``blocking=False`` the flush is skipped
+        when another thread holds the write lock.
+        """
+        if not self._lock.acquire(blocking=blocking):
+            return
+        try:
+            batch = self._log_pending
+            while True:
+                try:
+                    batch.append(self._log_queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return
+            # Older rows would be overwritten in the ring anyway.
+            del batch[:-LOG_RING_SIZE]
+            start = self._next_log_id
+            rows = [
+                ((start + offset) % LOG_RING_SIZE, ts, level, message)
+                for offset, (ts, level, message) in enumerate(batch)
+            ]
+            with self.transaction() as conn:
+                conn.executemany(SQL_INSERT_LOG, rows)
+            self._next_log_id = (start + len(batch)) % LOG_RING_SIZE
+            batch.clear()
+        finally:
+            self._lock.release()
+
+    def _log_flush_loop(self) -> None:
+        while not self._closed.is_set():
+            self._log_wakeup.wait(timeout=LOG_FLUSH_INTERVAL_SECONDS)
+            self._log_wakeup.clear()
+            try:
+                self.flush_logs()
+            except sqlite3.Error:  # pragma: no cover - keep the flusher alive
+                logger.exception("Failed to write queued log rows")
 
     def recent_logs(self, limit: int = 200) -> List[Tuple[float, str, str]]:
-        with self._connect() as conn:
-            cur = conn.execute(
-                "SELECT ts, level, message FROM logs ORDER BY ts DESC LIMIT ?",
-                (limit,),
-            )
+        # Best effort: write pending rows if the lock is free, but never wait for a writer.
+        self.flush_logs(blocking=False)
+        with self._read() as conn:
+            cur = conn.execute(SQL_SELECT_LOGS, (limit,))
             return cur.fetchall()
 
-    def register_idempotency(self, key: str, note: str, ts: float) -> None:
-        with self._connect() as conn:
-            conn.execute(
-                "INSERT OR IGNORE INTO idempotency(key, created_ts, note) VALUES(?, ?, ?)",
-                (key, ts, note),
+    def prune(self, before_ts: float) -> None:
+        """
+        Delete usage events and log rows older than ``before_ts``.
+
+        Rows are deleted and pages freed in batches of ``PRUNE_BATCH_SIZE``, each
+        in its own short write, so other writers are not held up by a large
+        backlog (for example the full log history of an upgraded database).
+        """
+        self.flush_logs()
+        for table in ("usage_events", "logs"):
+            sql = (
+                f"DELETE FROM {table} WHERE id IN "
+                f"(SELECT id FROM {table} WHERE ts < ? LIMIT ?)"
             )
-            conn.commit()
+            while True:
+                with self.transaction() as conn:
+                    deleted = conn.execute(sql, (before_ts, PRUNE_BATCH_SIZE)).rowcount
+                if deleted < PRUNE_BATCH_SIZE:
+                    break
+        # execute() only steps the pragma once, freeing a single page; executescript()
+        # runs it to completion. Databases created before auto_vacuum was enabled
+        # need a one-off VACUUM before this releases anything, so stop once a
+        # batch frees nothing.
+        while True:
+            with self._connect() as conn:
+                before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+                conn.executescript(f"PRAGMA incremental_vacuum({PRUNE_BATCH_SIZE});")
+                after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if not after or after >= before:
+                break
 
-    def has_idempotency(self, key: str) -> bool:
+    def try_register_idempotency(self, key: str, note: str, ts: float) -> bool:
+        """Record ``key``; return False if it was already registered."""
         with self._connect() as conn:
-            cur = conn.execute("SELECT 1 FROM idempotency WHERE key=?", (key,))
-            return cur.fetchone() is not None
+            cur = conn.execute(SQL_REGISTER_IDEMPOTENCY, (key, ts, note))
+            # Drain the cursor so the statement completes before any COMMIT.
+            return bool(cur.fetchall())